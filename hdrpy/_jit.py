@@ -0,0 +1,30 @@
+"""Optional Numba support.
+
+Kernels are decorated with `njit` and only called when `HAS_NUMBA` is True.
+Without Numba, `njit` leaves functions untouched, `prange` is `range`
+and `get_num_threads` returns 1,
+so modules defining kernels can still be imported and callers fall back
+to their NumPy implementations.
+"""
+# LLVM fast-math flags for kernels working on image data.
+# "nnan" and "ninf" are left out so that NaN and Inf propagate
+# the same way as in the NumPy implementations.
+FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+try:
+    from numba import get_num_threads, njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    prange = range
+
+    def get_num_threads():
+        return 1
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
@@ -1,3 +1,5 @@
+import functools
+import os
 from pathlib import Path
 from typing import Union
 
@@ -11,6 +13,17 @@ from colour import oetf, RGB_COLOURSPACES, RGB_luminance
 from hdrpy.format import Format
 
 
+# Y row of the BT.709 RGB to XYZ matrix used for YCbCr images
+_BT709_Y_WEIGHTS = RGB_COLOURSPACES["ITU-R BT.709"].matrix_RGB_to_XYZ[1, :]
+# (Y, Y * BY, Y * RY) to RGB, where R = Y (1 + RY), B = Y (1 + BY)
+# and G is solved from Y = wr R + wg G + wb B
+_wr, _wg, _wb = _BT709_Y_WEIGHTS
+_BT709_YCBCR_TO_RGB = np.array([
+    [1, 0, 1],
+    [(1 - _wr - _wb) / _wg, -_wb / _wg, -_wr / _wg],
+    [1, 1, 0]])
+
+
 class _OpenEXRReader():
     def __init__(self, ):
         self.pt = Imath.PixelType(Imath.PixelType.FLOAT)
@@ -18,61 +31,64 @@ class _OpenEXRReader():
 
     def imread(self, path):
         exrfile = OpenEXR.InputFile(path)
-        channel_type = set(exrfile.header()["channels"].keys())
+        # header() builds a new dict on every call, so it is read once
+        header = exrfile.header()
+        channel_type = set(header["channels"].keys())
         if channel_type >= {"R", "G", "B"}:
-            image = self.read_rgb_channels(exrfile)
+            image = self.read_rgb_channels(exrfile, header)
         elif channel_type >= {"Y", "BY", "RY"}:
-            image = self.read_ycbcr_channels(exrfile)
+            image = self.read_ycbcr_channels(exrfile, header)
         elif channel_type >= {"Y"}:
-            image = self.read_y_channel(exrfile)
+            image = self.read_y_channel(exrfile, header)
         else:
             raise TypeError("This channel type is not supported.")
 
         exrfile.close()
         return image
 
-    def read_rgb_channels(self, exrfile):
-        dw = exrfile.header()["dataWindow"]
+    def read_rgb_channels(self, exrfile, header):
+        dw = header["dataWindow"]
         size = (dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1)
-        (redstr, greenstr, bluestr) = exrfile.channels("RGB", self.pt)
-        red = np.fromstring(redstr, dtype=np.float32)
-        green = np.fromstring(greenstr, dtype=np.float32)
-        blue = np.fromstring(bluestr, dtype=np.float32)
-
-        image = np.zeros((size[1], size[0], 3), dtype=np.float)
-        image[:, :, 0] = red.reshape(size[1], size[0])
-        image[:, :, 1] = green.reshape(size[1], size[0])
-        image[:, :, 2] = blue.reshape(size[1], size[0])
-        return image
-
-    def read_ycbcr_channels(self, exrfile):
-        channel = exrfile.header()["channels"]
-        dw = exrfile.header()["dataWindow"]
+        channels = exrfile.channels("RGB", self.pt)
+
+        # Channels are stored planar and interleaved into float32 (H, W, 3)
+        # by a single copy, keeping the precision of the file
+        image = np.stack(
+            [np.frombuffer(chstr, dtype=np.float32) for chstr in channels],
+            axis=-1)
+        return image.reshape(size[1], size[0], 3)
+
+    def read_ycbcr_channels(self, exrfile, header):
+        channel = header["channels"]
+        dw = header["dataWindow"]
         size = (dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1)
 
-        image = np.zeros((size[1], size[0], 3), dtype=np.float)
-        for i, ch in enumerate(["Y", "BY", "RY"]):
-            chstr = exrfile.channel(ch, self.pt)
-            charray = np.fromstring(chstr, dtype=np.float32)
+        # All channels are read by one call so that each block is
+        # decompressed once. Subsampled chroma is upsampled plane by plane
+        # and the planes are interleaved into (H, W, 3) by a single copy
+        names = ["Y", "BY", "RY"]
+        planes = []
+        for ch, chstr in zip(names, exrfile.channels(names, self.pt)):
+            charray = np.frombuffer(chstr, dtype=np.float32)
             x_subsample = channel[ch].xSampling
             y_subsample = channel[ch].ySampling
-            charray.shape = (size[1]//y_subsample, size[0]//x_subsample)
-            image[:, :, i] = cv2.resize(charray, None,
-                                        fx=x_subsample, fy=y_subsample,
-                                        interpolation=cv2.INTER_LINEAR)
+            charray = charray.reshape(size[1]//y_subsample, size[0]//x_subsample)
+            if x_subsample != 1 or y_subsample != 1:
+                charray = cv2.resize(charray, None,
+                                     fx=x_subsample, fy=y_subsample,
+                                     interpolation=cv2.INTER_LINEAR)
+            planes.append(charray)
+        image = np.stack(planes, axis=-1)
         image = self.ycbcr_to_rgb(image)
 
         return image
 
-    def read_y_channel(self, exrfile):
-        dw = exrfile.header()["dataWindow"]
+    def read_y_channel(self, exrfile, header):
+        dw = header["dataWindow"]
         size = (dw.max.x - dw.min.x + 1, dw.max.y - dw.min.y + 1)
         chstr = exrfile.channel("Y", self.pt)
-        charray = np.fromstring(chstr, dtype=np.float32)
-        image = np.zeros((size[1], size[0], 3), dtype=np.float)
-        image[:, :, 0] = charray.reshape(size[1], size[0])
-        image[:, :, 1] = charray.reshape(size[1], size[0])
-        image[:, :, 2] = charray.reshape(size[1], size[0])
+        charray = np.frombuffer(chstr, dtype=np.float32)
+        image = np.repeat(charray.reshape(size[1], size[0], 1), 3, axis=2)
 
         return image
 
@@ -81,38 +97,52 @@ class _OpenEXRReader():
         pass
 
     def ycbcr_to_rgb(self, ycbcr):
-        colourspace = RGB_COLOURSPACES["ITU-R BT.709"]
-        y_weight = colourspace.matrix_RGB_to_XYZ[1, :]
-        rgb = np.zeros(ycbcr.shape, dtype=float)
-        rgb[:, :, 0] = ycbcr[:, :, 2] * ycbcr[:, :, 0] + ycbcr[:, :, 0]
-        rgb[:, :, 2] = ycbcr[:, :, 1] * ycbcr[:, :, 0] + ycbcr[:, :, 0]
-        rgb[:, :, 1] = (ycbcr[:, :, 0]
-                        - y_weight[0] * rgb[:, :, 0]
-                        - y_weight[2] * rgb[:, :, 2])
-        rgb[:, :, 1] /= y_weight[1]
-
-        return rgb
+        # BY and RY are chroma relative to Y; scaling them by Y
+        # makes the conversion a single 3x3 matrix product
+        pixels = ycbcr.reshape(-1, 3)
+        scaled = pixels * pixels[:, :1]
+        scaled[:, 0] = pixels[:, 0]
+        matrix = _BT709_YCBCR_TO_RGB.T.astype(ycbcr.dtype)
+        return np.dot(scaled, matrix).reshape(ycbcr.shape)
 
 
 _reader = _OpenEXRReader()
 
 
+@functools.lru_cache(maxsize=32)
+def _cached_imread(path, mtime_ns, size):
+    # mtime and size are part of the key so that rewritten files are decoded again
+    image = _reader.imread(path)
+    image.flags.writeable = False
+    return image
+
+
 class OpenEXRFormat(Format):
     """Handles HDR images written in the OpenEXR format,
     e.g., reading and writing
     """
 
     @staticmethod
-    def read(path: Union[Path, str]) -> np.ndarray:
+    def read(path: Union[Path, str], cache: bool = False) -> np.ndarray:
         """Reads an HDR image with OpenEXR format.
         Args:
             path: path to a file
+            cache: if True, the decoded image is kept in memory and
+                later reads of the unchanged file return a copy of it
+                instead of decoding the file again
         Return:
             image: readed image with a size of (H, W, C)
         >>> image = OpenEXRFormat.read("./data/CandleGlass.exr")
         >>> image.shape
-        (853, 1280, 3)
+        (810, 1000, 3)
+        >>> cached = OpenEXRFormat.read("./data/CandleGlass.exr", cache=True)
+        >>> np.array_equal(image, cached)
+        True
         """
+        if cache:
+            stat = os.stat(path)
+            return _cached_imread(
+                str(path), stat.st_mtime_ns, stat.st_size).copy()
         return _reader.imread(str(path))
     
     @staticmethod
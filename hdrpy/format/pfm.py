@@ -1,4 +1,4 @@
-import struct
+import sys
 from pathlib import Path
 from typing import Union
 
@@ -27,11 +27,17 @@ class PFMFormat(Format):
             w, h = f.readline().decode('ascii').strip().split(' ')
             w = int(w)
             h = int(h)
-            f.readline()
+            # a negative scale means little endian data
+            scale = float(f.readline().decode('ascii').strip())
+            dtype = np.dtype('<f4') if scale < 0 else np.dtype('>f4')
 
             siz = h * w * 3
-            image = np.array(struct.unpack('f' * siz, f.read(4 * siz)))
-            image = image.reshape((h, w, 3))
+            image = np.frombuffer(f.read(4 * siz), dtype=dtype)
+            if image.size != siz:
+                raise Exception('PFM image data is broken!!')
+            # scanlines are stored from bottom to top;
+            # the flip is folded into the copy made by astype
+            image = image.reshape((h, w, 3))[::-1].astype(np.float32)
 
         if image is None:
             raise Exception('Failed to load file "{0}"'.format(path))
@@ -55,11 +61,12 @@ class PFMFormat(Format):
         with open(path, 'wb') as f:
             f.write(bytearray('PF\n', 'ascii'))
             f.write(bytearray('{0:d} {1:d}\n'.format(w, h), 'ascii'))
-            f.write(bytearray('-1.0\n', 'ascii'))
+            # a negative scale means little endian data
+            scale = '-1.0' if sys.byteorder == 'little' else '1.0'
+            f.write(bytearray('{0}\n'.format(scale), 'ascii'))
 
-            siz = h * w * 3
-            tmp = image.reshape(siz)
-            f.write(struct.pack('f'*siz, *tmp))
+            # scanlines are stored from bottom to top
+            np.ascontiguousarray(image[::-1], dtype=np.float32).tofile(f)
 
 
 if __name__ == "__main__":
@@ -1,202 +1,441 @@
 import re
+import threading
 from pathlib import Path
 from typing import Union
 
 import numpy as np
 
+from hdrpy._jit import HAS_NUMBA, get_num_threads, njit, prange
 from hdrpy.format import Format
 
 
+# Scanlines can only be run length encoded for widths in this range
+_RLE_MIN_WIDTH = 8
+_RLE_MAX_WIDTH = 0x7fff
+_RESOLUTION_RE = re.compile(rb'([\-\+]Y) ([0-9]+) ([\-\+]X) ([0-9]+)')
+# 2^(exponent - 128) / 256 for every exponent byte.
+# Every value and every product with a mantissa is exact in float32.
+_RGBE_SCALE = np.ldexp(np.float32(1), np.arange(256) - (128 + 8)).astype(np.float32)
+
+
+@njit(cache=True, nogil=True)
+def _decode_rle_scanline(buf, pos, width, line):
+    """Expands one run length encoded RGBE scanline into `line`.
+    Args:
+        buf: uint8 array holding the encoded body
+        pos: position of the scanline data just after its 4-byte header
+        width: image width
+        line: uint8 array with a size of (4, W), one row per channel
+    Returns:
+        position just after the scanline, or -1 if `buf` is broken
+    """
+    size = buf.shape[0]
+    for ch in range(4):
+        x = 0
+        while x < width:
+            if pos >= size:
+                return -1
+            info = np.int64(buf[pos])
+            pos += 1
+            if info <= 128:
+                if x + info > width or pos + info > size:
+                    return -1
+                for i in range(info):
+                    line[ch, x + i] = buf[pos + i]
+                pos += info
+                x += info
+            else:
+                num = info - 128
+                if x + num > width or pos >= size:
+                    return -1
+                value = buf[pos]
+                pos += 1
+                for i in range(num):
+                    line[ch, x + i] = value
+                x += num
+    return pos
+
+
+@njit(fastmath=True, cache=True, nogil=True)
+def _rgbe_line_to_float32(line, scales, out, y):
+    """Converts a scanline of RGBE channel rows into `out[y]`.
+    Args:
+        line: uint8 array with a size of (4, W)
+        scales: float32 array of 2^(exponent - 128) / 256 for each exponent
+        out: float32 array with a size of (H, W, 3)
+        y: row to write
+    """
+    for x in range(line.shape[1]):
+        # value = mantissa * 2^(exponent - 128) / 256
+        scale = scales[line[3, x]]
+        out[y, x, 0] = line[0, x] * scale
+        out[y, x, 1] = line[1, x] * scale
+        out[y, x, 2] = line[2, x] * scale
+
+
+@njit(cache=True, nogil=True)
+def _decode_rle_rgbe(buf, width, height, scales, out):
+    """Decodes run length encoded RGBE scanlines straight into float RGB,
+    so only one scanline of RGBE bytes is held at a time.
+    Args:
+        buf: uint8 array holding the encoded body
+        width: image width
+        height: image height
+        scales: float32 array of 2^(exponent - 128) / 256 for each exponent
+        out: float32 array with a size of (H, W, 3)
+    Returns:
+        number of decoded scanlines, or -1 if `buf` is broken
+    """
+    line = np.empty((4, width), dtype=np.uint8)
+    pos = 0
+    size = buf.shape[0]
+    for y in range(height):
+        if pos + 4 > size or buf[pos] != 0x02 or buf[pos + 1] != 0x02:
+            return y
+        if ((np.int64(buf[pos + 2]) << 8) | buf[pos + 3]) != width:
+            return -1
+        pos = _decode_rle_scanline(buf, pos + 4, width, line)
+        if pos < 0:
+            return -1
+        _rgbe_line_to_float32(line, scales, out, y)
+    return height
+
+
+@njit(cache=True, nogil=True)
+def _find_rle_scanlines(buf, width, height, offsets):
+    """Finds where the data of each run length encoded scanline starts
+    by skipping over the runs without expanding them.
+    Args:
+        buf: uint8 array holding the encoded body
+        width: image width
+        height: image height
+        offsets: int64 array with a size of (H,) the positions are written to
+    Returns:
+        number of scanlines found, or -1 if `buf` is broken
+    """
+    pos = 0
+    size = buf.shape[0]
+    for y in range(height):
+        if pos + 4 > size or buf[pos] != 0x02 or buf[pos + 1] != 0x02:
+            return y
+        if ((np.int64(buf[pos + 2]) << 8) | buf[pos + 3]) != width:
+            return -1
+        pos += 4
+        offsets[y] = pos
+        for ch in range(4):
+            x = 0
+            while x < width:
+                if pos >= size:
+                    return -1
+                info = np.int64(buf[pos])
+                if info <= 128:
+                    x += info
+                    pos += 1 + info
+                else:
+                    x += info - 128
+                    pos += 2
+                if x > width or pos > size:
+                    return -1
+    return height
+
+
+@njit(parallel=True, cache=True)
+def _decode_rle_rgbe_parallel(buf, width, offsets, scales, out):
+    """Decodes scanlines found by `_find_rle_scanlines` in parallel
+    straight into float RGB.
+    """
+    for y in prange(offsets.shape[0]):
+        line = np.empty((4, width), dtype=np.uint8)
+        _decode_rle_scanline(buf, offsets[y], width, line)
+        _rgbe_line_to_float32(line, scales, out, y)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _rgbe_to_float32(planes, scales, out):
+    """Converts RGBE planes to floating point RGB in a single pass.
+    Args:
+        planes: uint8 array with a size of (4, H, W)
+        scales: float32 array of 2^(exponent - 128) / 256 for each exponent
+        out: float32 array with a size of (H, W, 3)
+    """
+    for y in prange(planes.shape[1]):
+        for x in range(planes.shape[2]):
+            # value = mantissa * 2^(exponent - 128) / 256
+            scale = scales[planes[3, y, x]]
+            out[y, x, 0] = planes[0, y, x] * scale
+            out[y, x, 1] = planes[1, y, x] * scale
+            out[y, x, 2] = planes[2, y, x] * scale
+
+
+@njit(fastmath=True, cache=True, nogil=True)
+def _rgbe_to_float32_serial(planes, scales, out):
+    """Single-threaded `_rgbe_to_float32` that releases the GIL,
+    for reads from threads other than the main thread.
+    """
+    for y in range(planes.shape[1]):
+        for x in range(planes.shape[2]):
+            scale = scales[planes[3, y, x]]
+            out[y, x, 0] = planes[0, y, x] * scale
+            out[y, x, 1] = planes[1, y, x] * scale
+            out[y, x, 2] = planes[2, y, x] * scale
+
+
+def _use_parallel_kernels():
+    """Returns whether the `parallel=True` kernels may be called.
+    They hold the GIL and Numba's workqueue threading layer aborts
+    the process when they are entered from several threads at once,
+    so other threads, e.g., those of `hdrpy.io.read_batch`,
+    use the serial kernels instead.
+    The thread is checked first because `get_num_threads` launches
+    the threading layer, which must not happen concurrently either.
+    """
+    return (threading.current_thread() is threading.main_thread()
+            and get_num_threads() > 1)
+
+
+@njit(cache=True)
+def _rle_encode_scanline(line, out, pos):
+    """Encodes one RGBE scanline channel by channel into `out`.
+    Runs of at least four equal bytes are written as (128 + count, value)
+    and everything in between as (count, values...).
+    Args:
+        line: uint8 array with a size of (W, 4)
+        out: uint8 buffer large enough for the encoded scanline
+        pos: position in `out` to start writing at
+    Returns:
+        position in `out` just after the encoded scanline
+    """
+    min_run = 4
+    width = line.shape[0]
+    for ch in range(4):
+        cursor = 0
+        while cursor < width:
+            # Find the next run that is long enough to be worth encoding
+            run_start = cursor
+            run_count = 0
+            old_run_count = 0
+            while run_count < min_run and run_start < width:
+                run_start += run_count
+                old_run_count = run_count
+                run_count = 1
+                while (run_start + run_count < width and run_count < 127
+                       and line[run_start, ch] == line[run_start + run_count, ch]):
+                    run_count += 1
+
+            # A short run right before the long one is still cheaper as a run
+            if old_run_count > 1 and old_run_count == run_start - cursor:
+                out[pos] = 128 + old_run_count
+                out[pos + 1] = line[cursor, ch]
+                pos += 2
+                cursor = run_start
+
+            # Literal values up to the start of the run
+            while cursor < run_start:
+                count = min(128, run_start - cursor)
+                out[pos] = count
+                pos += 1
+                for i in range(count):
+                    out[pos + i] = line[cursor + i, ch]
+                pos += count
+                cursor += count
+
+            if run_count >= min_run:
+                out[pos] = 128 + run_count
+                out[pos + 1] = line[run_start, ch]
+                pos += 2
+                cursor += run_count
+    return pos
+
+
 class _RadianceHDRReader(object):
     HDR_NONE = 0x00
     HDR_RLE_RGBE_32 = 0x01
 
     @classmethod
     def imread(cls, path):
+        # Read the whole file at once and walk it with a cursor
         with open(path, "rb") as im_file:
-            bufsize = 4096
+            data = im_file.read()
+        filetype, exposure, pos = cls.read_header(data)
+
+        # Read body section
+        width = 0
+        height = 0
+        end = data.find(b'\n', pos)
+        if end < 0:
+            raise Exception('HDR image size is invalid!!')
+        m = _RESOLUTION_RE.match(data, pos, end)
+        if m is not None and m.group(1) == b'-Y' and m.group(3) == b'+X':
+            width = int(m.group(4))
+            height = int(m.group(2))
+        else:
+            raise Exception('HDR image size is invalid!!')
+
+        body = memoryview(data)[end + 1:]
+        pos = 0
+
+        # Check byte array is truly RLE or not
+        if (not _RLE_MIN_WIDTH <= width <= _RLE_MAX_WIDTH
+                or len(body) < 2 or body[0] != 0x02 or body[1] != 0x02):
             filetype = cls.HDR_NONE
-            valid = False
-            exposure = 1.0
-
-            # Read header section
-            while True:
-                buf = im_file.readline(bufsize).decode('ascii')
-                if buf[0] == '#' and (buf == '#?RADIANCE\n' or buf == '#?RGBE\n'):
-                    valid = True
-                else:
-                    p = re.compile('FORMAT=(.*)')
-                    m = p.match(buf)
-                    if m is not None and m.group(1) == '32-bit_rle_rgbe':
-                        filetype = cls.HDR_RLE_RGBE_32
-                        continue
-
-                    p = re.compile('EXPOSURE=(.*)')
-                    m = p.match(buf)
-                    if m is not None:
-                        exposure = float(m.group(1))
-                        continue
-
-                if buf[0] == '\n':
-                    # Header section ends
-                    break
 
-            if not valid:
-                raise Exception('HDR header is invalid!!')
-
-            # Read body section
-            width = 0
-            height = 0
-            buf = im_file.readline(bufsize).decode()
-            p = re.compile('([\-\+]Y) ([0-9]+) ([\-\+]X) ([0-9]+)')
-            m = p.match(buf)
-            if m is not None and m.group(1) == '-Y' and m.group(3) == '+X':
-                width = int(m.group(4))
-                height = int(m.group(2))
-            else:
-                raise Exception('HDR image size is invalid!!')
-
-            # Check byte array is truly RLE or not
-            byte_start = im_file.tell()
-            now = ord(im_file.read(1))
-            now2 = ord(im_file.read(1))
-            if now != 0x02 or now2 != 0x02:
-                filetype = HDR_NONE
-            im_file.seek(byte_start)
-
-            if filetype == cls.HDR_RLE_RGBE_32:
-                # Run length encoded HDR
-                tmpdata = np.zeros((width * height * 4), dtype=np.uint8)
-                nowy = 0
-                while True:
-                    now = -1
-                    now2 = -1
-                    try:
-                        now = ord(im_file.read(1))
-                        now2 = ord(im_file.read(1))
-                    except:
-                        break
-
-                    if now != 0x02 or now2 != 0x02:
-                        break
-
-                    A = ord(im_file.read(1))
-                    B = ord(im_file.read(1))
-                    width = (A << 8) | B
+        img = None
+        if filetype == cls.HDR_RLE_RGBE_32 and HAS_NUMBA:
+            # Run length encoded HDR, decoded by the compiled kernels
+            # straight into float RGB; missing scanlines are left black
+            img = np.zeros((height, width, 3), dtype=np.float32)
+            buf = np.frombuffer(body, dtype=np.uint8)
+            if _use_parallel_kernels():
+                offsets = np.empty(height, dtype=np.int64)
+                nrows = _find_rle_scanlines(buf, width, height, offsets)
+                if nrows < 0:
+                    raise Exception('HDR image data is broken!!')
+                _decode_rle_rgbe_parallel(
+                    buf, width, offsets[:nrows], _RGBE_SCALE, img)
+            elif _decode_rle_rgbe(buf, width, height, _RGBE_SCALE, img) < 0:
+                raise Exception('HDR image data is broken!!')
+        elif filetype == cls.HDR_RLE_RGBE_32:
+            # Run length encoded HDR
+            planes = np.zeros((4, height, width), dtype=np.uint8)
+            buf = np.frombuffer(body, dtype=np.uint8)
+            nowy = 0
+            while nowy < height and pos + 4 <= len(body):
+                if body[pos] != 0x02 or body[pos + 1] != 0x02:
+                    break
+                if ((body[pos + 2] << 8) | body[pos + 3]) != width:
+                    raise Exception('HDR image data is broken!!')
+                pos += 4
 
+                for nowv in range(4):
+                    row = planes[nowv, nowy]
                     nowx = 0
-                    nowv = 0
-                    while True:
-                        if nowx >= width:
-                            nowv += 1
-                            nowx = 0
-                            if nowv == 4:
-                                break
-
-                        info = ord(im_file.read(1))
+                    while nowx < width:
+                        # Same checks as _decode_rle_scanline
+                        if pos >= len(body):
+                            raise Exception('HDR image data is broken!!')
+                        info = body[pos]
+                        pos += 1
                         if info <= 128:
-                            data = im_file.read(info)
-                            for i in range(info):
-                                tmpdata[(nowy * width + nowx) * 4 + nowv] = data[i]
-                                nowx += 1
+                            if nowx + info > width or pos + info > len(body):
+                                raise Exception('HDR image data is broken!!')
+                            row[nowx:nowx + info] = buf[pos:pos + info]
+                            pos += info
+                            nowx += info
                         else:
                             num = info - 128
-                            data = ord(im_file.read(1))
-                            for i in range(num):
-                                tmpdata[(nowy * width + nowx) * 4 + nowv] = data
-                                nowx += 1
-
-                    nowy += 1
-
-                tmpdata = tmpdata.reshape((height, width, 4))
-            else:
-                # Non-encoded HDR format
-                totsize = width * height * 4
-                tmpdata = struct.unpack('B' * totsize, im_file.read(totsize))
-                tmpdata = np.asarray(tmpdata, np.uint8).reshape((height, width, 4))
-
-            expo = np.power(2.0, tmpdata[:,:,3] - 128.0) / 256.0
-            img = np.multiply(tmpdata[:,:,0:3], expo[:,:,np.newaxis])
+                            if nowx + num > width or pos >= len(body):
+                                raise Exception('HDR image data is broken!!')
+                            row[nowx:nowx + num] = body[pos]
+                            pos += 1
+                            nowx += num
+
+                nowy += 1
+        else:
+            # Non-encoded HDR format
+            totsize = width * height * 4
+            if len(body) < totsize:
+                raise Exception('HDR image data is broken!!')
+            tmpdata = np.frombuffer(body, dtype=np.uint8, count=totsize)
+            planes = tmpdata.reshape((height, width, 4)).transpose(2, 0, 1)
 
         if img is None:
-            raise Exception('Failed to load file "{0}"'.format(path))
+            img = np.empty((height, width, 3), dtype=np.float32)
+            if HAS_NUMBA and _use_parallel_kernels():
+                _rgbe_to_float32(planes, _RGBE_SCALE, img)
+            elif HAS_NUMBA:
+                _rgbe_to_float32_serial(planes, _RGBE_SCALE, img)
+            else:
+                # value = mantissa * 2^(exponent - 128) / 256,
+                # interleaving the planes into (H, W, 3) on the way
+                exponent = planes[3].astype(np.int32) - (128 + 8)
+                np.ldexp(planes[0:3].transpose(1, 2, 0),
+                         exponent[:, :, np.newaxis],
+                         out=img, dtype=np.float32)
 
         return img
 
     @classmethod
-    def read_header(cls, im_file):
-        while True:
-            buf = im_file.readline(bufsize).decode('ascii')
-            if buf[0] == '#' and (buf == '#?RADIANCE\n' or buf == '#?RGBE\n'):
+    def read_header(cls, data):
+        """Reads the header section of a Radiance HDR file.
+        Args:
+            data: bytes of the whole file
+        Returns:
+            (filetype, exposure, pos), where pos is the position
+            of the resolution string just after the header
+        """
+        end = data.find(b'\n\n')
+        if end < 0:
+            raise Exception('HDR header is invalid!!')
+
+        filetype = cls.HDR_NONE
+        valid = False
+        exposure = 1.0
+        for line in data[:end].split(b'\n'):
+            if line == b'#?RADIANCE' or line == b'#?RGBE':
                 valid = True
-            else:
-                p = re.compile('FORMAT=(.*)')
-                m = p.match(buf)
-                if m is not None and m.group(1) == '32-bit_rle_rgbe':
+            elif line.startswith(b'FORMAT='):
+                if line[7:] == b'32-bit_rle_rgbe':
                     filetype = cls.HDR_RLE_RGBE_32
-                    continue
-                p = re.compile('EXPOSURE=(.*)')
-                m = p.match(buf)
-                if m is not None:
-                    exposure = float(m.group(1))
-                    continue
-            if buf[0] == '\n':
-                # Header section ends
-                break
+            elif line.startswith(b'EXPOSURE='):
+                exposure = float(line[9:])
         if not valid:
             raise Exception('HDR header is invalid!!')
+        return filetype, exposure, end + 2
 
 
 class _RadianceHDRWriter(object):
+    EPS = 1e-32
+
     @classmethod
     def save(cls, filename, img):
         """
         Save .hdr format
         """
+        [height, width, dim] = img.shape
+        if dim != 3:
+            raise Exception('HDR image must have 3 channels')
+
         with open(filename, 'wb') as f:
             # Write header
-            ret = 0x0a
-            strwrite(f, '#?RADIANCE%c' % ret)
-            strwrite(f, '# Generated by hdrpy%c' % ret)
-            strwrite(f, 'FORMAT=32-bit_rle_rgbe%c' % ret)
-            strwrite(f, 'EXPOSURE=1.0000000000000%c%c' % (ret, ret))
+            f.write(b'#?RADIANCE\n')
+            f.write(b'# Generated by hdrpy\n')
+            f.write(b'FORMAT=32-bit_rle_rgbe\n')
+            f.write(b'EXPOSURE=1.0000000000000\n\n')
 
             # Write size
-            [height, width, dim] = img.shape
-            if dim != 3:
-                raise Exception('HDR image must have 3 channels')
-
-            strwrite(f, '-Y %d +X %d%c' % (height, width, ret))
-
-            line = np.zeros((width, 4))
+            f.write('-Y {0:d} +X {1:d}\n'.format(height, width).encode('ascii'))
+
+            # Other widths are written as flat RGBE scanlines
+            rle = _RLE_MIN_WIDTH <= width <= _RLE_MAX_WIDTH
+            # Scanline header plus at most one count byte per 127 values
+            out = np.empty(4 + 4 * (width + width // 127 + 1), dtype=np.uint8)
+            out[0:4] = (0x02, 0x02, (width >> 8) & 0xff, width & 0xff)
+            # Per-row buffers reused for every scanline
+            line = np.empty((width, 4))
+            line_u8 = np.empty((width, 4), dtype=np.uint8)
+            d = np.empty(width)
             for i in range(height):
-                f.write(struct.pack('BBBB', 0x02, 0x02, (width >> 8) & 0xff, width & 0xff))
-
-                d = np.max(img[i], axis=1)
-                zero_ids = np.where(d < hydra.core.EPS)
+                np.max(img[i], axis=1, out=d)
+                zero_ids = d < cls.EPS
                 m, ie = np.frexp(d)
-                d = m * 256.0 / d
+                np.divide(m * 256.0, d, out=d, where=~zero_ids)
                 d[zero_ids] = 0.0
+                ie[zero_ids] = -128
 
-                line[:, :3] = img[i] * np.tile(d[:, np.newaxis], [1, 3])
-                line[:, 3] = ie + 128
-                line = np.clip(line, 0.0, 255.0).astype(np.uint8)
+                np.multiply(img[i], d[:, np.newaxis], out=line[:, :3])
+                np.add(ie, 128, out=line[:, 3])
+                np.clip(line, 0.0, 255.0, out=line)
+                np.copyto(line_u8, line, casting='unsafe')
 
-                buf = []
-                for ch in range(4):
-                    cursor = 0
-                    while cursor < width:
-                        cursor_move = min(127, width - cursor)
-                        buf.append(cursor_move)
-                        for j in range(cursor, cursor + cursor_move):
-                            buf.append(line[j, ch])
-                        cursor += cursor_move
-
-            f.write(struct.pack('B' * len(buf), *buf))
+                if rle:
+                    n = _rle_encode_scanline(line_u8, out, 4)
+                    f.write(out[:n].tobytes())
+                else:
+                    f.write(line_u8.tobytes())
 
 
 _reader = _RadianceHDRReader()
-# _writer = _RadianceHDRWriter()
+_writer = _RadianceHDRWriter()
 
 
 class RadianceHDRFormat(Format):
@@ -230,7 +469,7 @@ class RadianceHDRFormat(Format):
         >>> image.shape
         (100, 100, 3)
         """
-        raise NotImplementedError()
+        _writer.save(str(path), image)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,43 @@
 from typing import Union, Optional
 
 import numpy as np
-from colour import oetf, RGB_COLOURSPACES, RGB_luminance
+from colour import oetf, RGB_COLOURSPACES
+from colour.models import normalised_primary_matrix
+
+from hdrpy._jit import FASTMATH, HAS_NUMBA, njit, prange
+
+
+_SRGB = RGB_COLOURSPACES["sRGB"]
+# Y row of the sRGB to XYZ matrix, i.e., the weights RGB_luminance derives per call
+_SRGB_LUMINANCE_WEIGHTS = normalised_primary_matrix(_SRGB.primaries, _SRGB.whitepoint)[1]
+
+
+@njit(parallel=True, fastmath=FASTMATH, cache=True)
+def _weighted_sum(image, weights, out):
+    """Computes the weighted sum of channels of `image` with a size of (N, 3).
+    """
+    for i in prange(image.shape[0]):
+        out[i] = (weights[0] * image[i, 0]
+                  + weights[1] * image[i, 1]
+                  + weights[2] * image[i, 2])
 
 
 def get_luminance(image: np.ndarray) -> np.ndarray:
-    colourspace = RGB_COLOURSPACES["sRGB"]
-    lum = RGB_luminance(image, colourspace.primaries, colourspace.whitepoint)
-    return lum
\ No newline at end of file
+    # colour computes in float64; keep the precision of the input image
+    if np.issubdtype(image.dtype, np.floating):
+        dtype = image.dtype
+    else:
+        dtype = np.float64
+    weights = _SRGB_LUMINANCE_WEIGHTS.astype(dtype)
+
+    if HAS_NUMBA and image.shape[-1] == 3:
+        image = np.ascontiguousarray(image, dtype=dtype)
+        lum = np.empty(image.shape[:-1], dtype=dtype)
+        _weighted_sum(image.reshape(-1, 3), weights, lum.reshape(-1))
+        return lum
+
+    if image.shape[-1] == 1:
+        # Single channel images are broadcast over the weights as colour does
+        return np.sum(image.astype(dtype, copy=False) * weights, axis=-1)
+
+    return np.dot(image.astype(dtype, copy=False), weights)
@@ -1,2 +1,2 @@
-from hdrpy.io.imread import read
+from hdrpy.io.imread import read, read_batch
 from hdrpy.io.imwrite import write
@@ -1,10 +1,12 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Union, Optional
+from typing import Union, Optional, Sequence
 
 import numpy as np
+from PIL import Image
 
-from hdrpy.stats import min_max_normalization
-from hdrpy.format import RadianceHDRFormat, PFMFormat, OpenEXRFormat
+from hdrpy.format import RadianceHDRFormat, PFMFormat
 
 
 HDR_IMG_EXTENSIONS = ('.hdr', '.exr', '.pfm')
@@ -16,15 +18,18 @@ def has_file_allowed_extension(
     """Checks if a file is an allowed extension.
     Args:
         filename: path to a file
-        extensions: extensions to consider (lowercase)
+        extensions: extensions to consider (lowercase),
+            preferably a set for large collections
     Returns:
         bool: True if the filename ends with one of given extensions
     >>> has_file_allowed_extension("image.hdr", (".hdr", ".exr", ".pfm"))
     True
     >>> has_file_allowed_extension("image.hrd", (".hdr", ".exr", ".pfm"))
     False
+    >>> has_file_allowed_extension(Path("data/image.EXR"), frozenset(HDR_IMG_EXTENSIONS))
+    True
     """
-    return filename.lower().endswith(extensions)
+    return Path(filename).suffix.lower() in extensions
 
 
 def read(path: Union[Path, str],
@@ -55,58 +60,97 @@ def read(path: Union[Path, str],
     reader = ReaderFactory.create(path)
     image = reader(path)
 
-    if nan_sub is not None:
-        image[np.isnan(image)] = nan_sub
-    if inf_sub is not None:
-        image[np.isinf(image)] = inf_sub
+    if nan_sub is not None or inf_sub is not None:
+        nan = np.nan if nan_sub is None else nan_sub
+        posinf = np.inf if inf_sub is None else inf_sub
+        neginf = -np.inf if inf_sub is None else inf_sub
+        image = np.nan_to_num(
+            image, copy=False, nan=nan, posinf=posinf, neginf=neginf)
 
     return image
 
 
+def read_batch(paths: Sequence[Union[Path, str]],
+               nan_sub: Optional[float] = None,
+               inf_sub: Optional[float] = None,
+               workers: Optional[int] = None) -> list[np.ndarray]:
+    """Reads HDR image files concurrently with a thread pool.
+    In worker threads, the Radiance HDR decoder uses its serial kernels,
+    which release the GIL, so those files are decoded in parallel.
+    Other formats are decoded in parallel as far as
+    their libraries release the GIL.
+    Args:
+        paths: paths to files
+        nan_sub: value used for substituting NaN
+        inf_sub: value used for substituting Inf
+        workers: maximum number of threads.
+            If None, the default of ThreadPoolExecutor is used.
+    Returns:
+        images: list of readed images in the same order as `paths`
+    >>> images = read_batch(["./data/memorial_o876.hdr", "./data/Flowers.pfm"])
+    >>> [image.shape for image in images]
+    [(768, 512, 3), (853, 1280, 3)]
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(
+            lambda path: read(path, nan_sub=nan_sub, inf_sub=inf_sub), paths))
+
+
+def _pil_reader(path: Union[Path, str]) -> np.ndarray:
+    """Reads an LDR image with Pillow and normalizes it into [0, 1] range
+    as float32.
+    """
+    # open path as file to avoid ResourceWarning (https://github.com/python-pillow/Pillow/issues/835)
+    with open(path, 'rb') as f:
+        img = Image.open(f)
+        img = np.asarray(img.convert("RGB"))
+    if np.issubdtype(img.dtype, np.integer):
+        info = np.iinfo(img.dtype)
+    elif np.issubdtype(img.dtype, np.floating):
+        info = np.finfo(img.dtype)
+    else:
+        raise TypeError()
+
+    min_ = float(info.min)
+    max_ = float(info.max)
+    # Cast and shift in one pass, then scale in place
+    image = np.subtract(img, min_, dtype=np.float32)
+    np.divide(image, max_ - min_, out=image)
+    return image
+
+
+_READERS = {
+    ".hdr": RadianceHDRFormat.read,
+    ".pfm": PFMFormat.read,
+}
+try:
+    from hdrpy.format import OpenEXRFormat
+    _READERS[".exr"] = OpenEXRFormat.read
+except ImportError:
+    pass
+
+
 class ReaderFactory(object):
     """Builds a HDR image reader for given image name.
     """
     @staticmethod
     def create(path: Union[Path, str]):
         """Returns a function for reading an image file at `path`.
+        Images with an unknown extension are assumed to be LDR.
         Args:
             path: path to a file to be read
         Return:
             reader: python function for reading image at `path`
-        Raises:
-            NotImplementedError
         >>> type(ReaderFactory.create("test.hdr"))
         <class 'function'>
+        >>> ReaderFactory.create(Path("test.PNG")) is _pil_reader
+        True
         """
         if isinstance(path, str):
-            path = Path(path)
-        
-        ext = path.suffix.lower()
-        if ext == ".hdr":
-            reader = RadianceHDRFormat.read
-        elif ext == ".exr":
-            reader = OpenEXRFormat.read
-        elif ext == ".pfm":
-            reader = PFMFormat.read
+            ext = os.path.splitext(path)[1].lower()
         else:
-            # assuming the image is LDR
-            def pil_reader(path: Union[Path, str]) -> np.ndarray:
-                # open path as file to avoid ResourceWarning (https://github.com/python-pillow/Pillow/issues/835)
-                with open(path, 'rb') as f:
-                    img = Image.open(f)
-                img = np.asarray(img.convert("RGB"))
-                if img.dtype.startswith("uint") or img.dtype.startswith("int"):
-                    info = np.iinfo(img.dtype)
-                elif img.dtype.startswith("float"):
-                    info = np.finfo(img.dtype)
-                else:
-                    raise TypeError()
-
-                min_ = float(info.min)
-                max_ = float(info.max)
-                return min_max_normalization(img.astype(np.float64), min_, max_)    
-            reader = pil_reader
-        return reader
+            ext = path.suffix.lower()
+        return _READERS.get(ext, _pil_reader)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,12 @@
+import os
 from pathlib import Path
 from typing import Union, Optional
 
 import numpy as np
 from PIL import Image
 
+from hdrpy._jit import HAS_NUMBA, njit, prange
 from hdrpy.format import RadianceHDRFormat, PFMFormat
-try:
-    from hdrpy.format import OpenEXRFormat
-except ImportError:
-    pass
 
 
 def write(
@@ -30,10 +28,12 @@ def write(
     if isinstance(path, str):
         path = Path(path)
     
-    if nan_sub is not None:
-        image[np.isnan(image)] = nan_sub
-    if inf_sub is not None:
-        image[np.isinf(image)] = inf_sub
+    if nan_sub is not None or inf_sub is not None:
+        nan = np.nan if nan_sub is None else nan_sub
+        posinf = np.inf if inf_sub is None else inf_sub
+        neginf = -np.inf if inf_sub is None else inf_sub
+        image = np.nan_to_num(
+            image, copy=False, nan=nan, posinf=posinf, neginf=neginf)
 
     writer = WriterFactory.create(path)
     image = writer(path, image)
@@ -41,37 +41,65 @@ def write(
     return image
 
 
+@njit(parallel=True, cache=True)
+def _quantize_uint8(image, scale, out):
+    """Clips flat arrays to [0, 1], scales them by `scale`
+    and truncates them to uint8 in a single pass.
+    NaN becomes 0. `scale` is expected to have the dtype of `image`.
+    """
+    for i in prange(image.size):
+        x = image[i]
+        if x > 1:
+            x = 1
+        if not x > 0:
+            x = 0
+        out[i] = np.uint8(x * scale)
+
+
+def _pil_writer(path: Union[Path, str], image: np.ndarray) -> None:
+    """Writes an image in [0, 1] range as an 8-bit LDR image with Pillow.
+    """
+    if HAS_NUMBA and image.dtype in (np.float32, np.float64):
+        image = np.ascontiguousarray(image)
+        ldr = np.empty(image.shape, dtype=np.uint8)
+        _quantize_uint8(image.reshape(-1),
+                        image.dtype.type(np.iinfo("uint8").max),
+                        ldr.reshape(-1))
+    else:
+        image = np.clip(image, 0, 1)
+        image *= np.iinfo("uint8").max
+        ldr = image.astype(np.uint8)
+    Image.fromarray(ldr).save(str(path))
+
+
+_WRITERS = {
+    ".hdr": RadianceHDRFormat.write,
+    ".pfm": PFMFormat.write,
+}
+try:
+    from hdrpy.format import OpenEXRFormat
+    _WRITERS[".exr"] = OpenEXRFormat.write
+except ImportError:
+    pass
+
+
 class WriterFactory(object):
     @staticmethod
     def create(path: Union[Path, str]):
         """Returns a function for writing an image file to `path`.
+        Images with an unknown extension are written as LDR.
         Args:
             path: path to a file to be wrote
         Returns:
             writer: python function for writing image at `path`
-        Raises:
-            NotImplementedError
         >>> type(WriterFactory.create("test.pfm"))
         <class 'function'>
         """
         if isinstance(path, str):
-            path = Path(path)
-        
-        ext = path.suffix.lower()
-        if ext == ".hdr":
-            raise NotImplementedError()
-        elif ext == ".exr":
-            raise NotImplementedError()
-        elif ext == ".pfm":
-            writer = PFMFormat.write
+            ext = os.path.splitext(path)[1].lower()
         else:
-            def pil_writer(path: Union[Path, str], image: np.ndarray) -> None:
-                image = np.clip(image, 0, 1)
-                image *= np.iinfo("uint8").max
-                Image.fromarray(image.astype(np.uint8)).save(str(path))
-            writer = pil_writer
-        return writer
-
+            ext = path.suffix.lower()
+        return _WRITERS.get(ext, _pil_writer)
 
 
 if __name__ == "__main__":
@@ -4,9 +4,65 @@ import argparse
 import sys
 # import hdrpy
 import math
-from cv2.ximgproc import guidedFilter
-# from core.filter import GuidedFilter
-from gf import guided_filter
+
+
+def guided_filter(guide, src, r, eps, s=1):
+    """Guided filter for single channel images.
+    With `s` greater than 1, the linear coefficients are computed on
+    images subsampled by `s` and upsampled again (fast guided filter),
+    which reduces the box filtering to 1/s^2 of the pixels.
+    Args:
+        guide: guidance image with a size of (H, W)
+        src: image to be filtered with a size of (H, W)
+        r: radius of the box window
+        eps: regularization parameter
+        s: subsampling ratio
+    Returns:
+        filtered image with a size of (H, W)
+    """
+    height, width = guide.shape[:2]
+    self_guided = src is guide
+    guide_sub = guide
+    src_sub = src
+    if s > 1:
+        guide_sub = cv2.resize(guide, None, fx=1 / s, fy=1 / s,
+                               interpolation=cv2.INTER_NEAREST)
+        src_sub = guide_sub if self_guided else cv2.resize(
+            src, None, fx=1 / s, fy=1 / s, interpolation=cv2.INTER_NEAREST)
+        r = max(r // s, 1)
+    ksize = (2 * r + 1, 2 * r + 1)
+
+    mean_I = cv2.boxFilter(guide_sub, -1, ksize)
+    var_I = cv2.boxFilter(guide_sub * guide_sub, -1, ksize) - mean_I * mean_I
+    if self_guided:
+        # the input shares its means with the guide
+        mean_p = mean_I
+        cov_Ip = var_I
+    else:
+        mean_p = cv2.boxFilter(src_sub, -1, ksize)
+        cov_Ip = cv2.boxFilter(guide_sub * src_sub, -1, ksize) - mean_I * mean_p
+
+    a = cov_Ip / (var_I + eps)
+    b = mean_p - a * mean_I
+    mean_a = cv2.boxFilter(a, -1, ksize)
+    mean_b = cv2.boxFilter(b, -1, ksize)
+    if s > 1:
+        mean_a = cv2.resize(mean_a, (width, height),
+                            interpolation=cv2.INTER_LINEAR)
+        mean_b = cv2.resize(mean_b, (width, height),
+                            interpolation=cv2.INTER_LINEAR)
+    return mean_a * guide + mean_b
+
+
+def _gaussian_weight(x, sigma):
+    """Computes exp(-(x - 0.5)^2 / (2 sigma^2)) in a single buffer.
+    """
+    weight = np.subtract(x, 0.5)
+    np.square(weight, out=weight)
+    np.divide(weight, -2 * sigma ** 2, out=weight)
+    np.exp(weight, out=weight)
+    return weight
+
 
 class MertensFusion:
     def __init__(self):
@@ -20,6 +76,7 @@ class NejatiFusion:
     def __init__(self):
         self.r = 12
         self.eps = 0.25
+        self.subsample = 4
         self.sigma_D = 0.12
         self.sigma_l = 0.5
         self.sigma_g = 0.2
@@ -31,15 +88,17 @@ class NejatiFusion:
         base_weight_list = []
         detail_weight_list = []
 
-        for i, img in enumerate(self.img_list):
-            img = img / 255
-            img = img.astype(np.float32)
+        for i, img in enumerate(images):
+            # 8-bit images are scaled into [0, 1] directly in float32
+            img = np.divide(img, 255, dtype=np.float32)
+            # the luminance is shared by the decomposition and the weights
+            lum = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-            [base, detail] = self.decompose(img)
+            [base, detail] = self.decompose(img, lum)
             baselayer_list.append(base)
             detaillayer_list.append(detail)
 
-            base_weight = self.weight_base(img, base)
+            base_weight = self.weight_base(lum, base)
             base_weight_list.append(base_weight)
 
             detail_weight = self.weight_detail(lum)
@@ -51,53 +110,44 @@ class NejatiFusion:
         return self.compose(fused_base, fused_detail)
 
     # decompose an image into a base layer and a detail layer
-    def decompose(self, image):
-        lum = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        base = guided_filter(lum, lum, self.r, self.eps)
-        detail = np.zeros(self.img_list[0].shape)
-        for i in range(3):
-            detail[:, :, i] = img[:, :, i] - baselayer
+    def decompose(self, image, lum):
+        base = guided_filter(lum, lum, self.r, self.eps, self.subsample)
+        # the base layer is broadcast over the color channels
+        detail = image - base[:, :, np.newaxis]
         return [base, detail]
 
     # combine a base layer with a detail layer
     def compose(self, base, detail):
-        image = np.zeros(detail.shape)
-        for i in range(3):
-            image[:, :, i] = base + (self.alpha * detail[:, :, i])
+        image = self.alpha * detail
+        image += base[:, :, np.newaxis]
         return image
 
     # calculate weights for a base layer
-    def weight_base(self, image, base):
-        lum = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        weight_B_l = np.exp(-((base - 0.5) ** 2) / (2 * (self.sigma_l ** 2)))
+    def weight_base(self, lum, base):
+        weight_B_l = _gaussian_weight(base, self.sigma_l)
         weight_B_g = np.exp(-((lum.mean() - 0.5) ** 2) / (2 * (self.sigma_g ** 2)))
-        return weight_B_l * weight_B_g
+        weight_B_l *= weight_B_g
+        return weight_B_l
 
     # calculate weights for a detail layer
-    def weight_detail(self, image):
-        lum = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def weight_detail(self, lum):
         fai_D = cv2.blur(lum, (7, 7))
-        return np.exp(-((fai_D - 0.5) ** 2) / (2 * (self.sigma_D ** 2)))
+        return _gaussian_weight(fai_D, self.sigma_D)
 
     def fuse_base(self, base_layers, weights):
         normalized_weights = self.normalize_weights(weights)
-        fused_base = np.zeros(base_layers[0].shape)
-        for base, weight in zip(base_layers, normalized_weights):
-            fused_base += weight * base
-        return fused_base
+        return np.einsum("khw,khw->hw",
+                         normalized_weights, np.stack(base_layers))
 
     def fuse_detail(self, detail_layers, weights):
         normalized_weights = self.normalize_weights(weights)
-        fused_detail = np.zeros(detail_layers[0].shape)
-        for detail, weight in zip(detail_layers, normalized_weights):
-            fused_detail += weight * detail
-        return fused_detail
+        # the weight of a pixel is shared by its color channels
+        return np.einsum("khw,khwc->hwc",
+                         normalized_weights, np.stack(detail_layers))
 
     def normalize_weights(self, weights):
-        total_weight = np.zeros(weights[0].shape)
-        normalized_weights = []
-        for weight in weights:
-            total_weight += weight
-        for weight in weights:
-            normalized_weights.append(weight / total_weight)
+        # weights are stacked into one (K, H, W) array and normalized in place
+        normalized_weights = np.stack(weights)
+        total_weight = normalized_weights.sum(axis=0)
+        np.divide(normalized_weights, total_weight, out=normalized_weights)
         return normalized_weights
@@ -15,7 +15,10 @@ def gmean(
         a: Input array
         axis: Axis along which the geometric mean is computed.
             If None, compute over the whole array `a`.
-        eps: Small value for stability
+        eps: Small value for stability, which replaces zeros,
+            negative values and NaN.
+            If None, the values are used as they are,
+            which is faster when `a` is known to be positive.
 
     Returns:
         gmean: The geometric mean of `a`
@@ -28,14 +31,77 @@ def gmean(
     >>> import hdrpy
     >>> hdr = hdrpy.io.read("./data/CandleGlass.exr")
     >>> gmean(hdrpy.image.get_luminance(hdr))
-    0.00040137774000534386
+    0.00040137771
     """
-    a_c = a.copy()
+    log_mean = logmean(a, axis=axis, eps=eps)
+    if axis is None:
+        # the float64 mean is rounded to the precision of `a`
+        dtype = a.dtype if np.issubdtype(a.dtype, np.floating) else np.float64
+        return np.exp(np.dtype(dtype).type(log_mean))
+    return np.exp(log_mean)
+
+
+def logmean(
+    a: np.ndarray,
+    axis: Optional[int] = None,
+    eps: Optional[float] = 1e-6):
+    """Computes the arithmetic mean of the logarithm of `a`
+    along the specified axis, i.e., the logarithm of its geometric mean.
+
+    Args:
+        a: Input array
+        axis: Axis along which the mean is computed.
+            If None, compute over the whole array `a`
+            and accumulate the sum in float64.
+        eps: Small value for stability, which replaces zeros,
+            negative values and NaN.
+            If None, the values are used as they are.
+
+    Returns:
+        logmean: The mean of the logarithm of `a`
+
+    Examples:
+    >>> logmean(np.array([1, 4]))
+    0.6931471805599453
+    """
+    if axis is None:
+        return _logmean_blocked(a, eps)
+
     if eps is not None:
-        a_c[a_c <= 0] = eps
-        a_c[np.isnan(a_c)] = eps
-    log_a = np.log(a_c)
-    return np.exp(log_a.mean(axis=axis))
+        # NaN fails the comparison as well, so both are replaced in one pass
+        log_a = np.where(a > 0, a, eps)
+        np.log(log_a, out=log_a)
+    else:
+        log_a = np.log(a)
+    return log_a.mean(axis=axis)
+
+
+def _logmean_blocked(
+    a: np.ndarray,
+    eps: Optional[float],
+    block: int = 1 << 16) -> float:
+    """Computes the mean of logarithms over the whole array block by block,
+    so that the logarithms never need a buffer as large as `a`.
+    The sum of logarithms is accumulated in float64.
+    """
+    flat = np.ascontiguousarray(a).reshape(-1)
+    if flat.size == 0:
+        return float(np.mean(flat))
+    dtype = flat.dtype if np.issubdtype(flat.dtype, np.floating) else np.float64
+    buf = np.empty(min(block, flat.size), dtype=dtype)
+    log_sum = 0.0
+    for start in range(0, flat.size, block):
+        chunk = flat[start:start + block]
+        log_a = buf[:chunk.size]
+        if eps is None:
+            np.log(chunk, out=log_a)
+        else:
+            # NaN fails the comparison as well, so both are replaced with eps
+            log_a.fill(eps)
+            np.copyto(log_a, chunk, where=chunk > 0)
+            np.log(log_a, out=log_a)
+        log_sum += float(log_a.sum(dtype=np.float64))
+    return log_sum / flat.size
 
 
 def min_max_normalization(
@@ -58,6 +124,8 @@ def min_max_normalization(
     True
     >>> np.all(a >= 0)
     True
+    >>> min_max_normalization(np.arange(5), 0, 4)
+    array([ 0.  ,  0.25,  0.5 ,  0.75,  1.  ])
     """
     if min_ is None:
         min_ = float(np.amin(a))
@@ -65,7 +133,11 @@ def min_max_normalization(
     if max_ is None:
         max_ = float(np.amax(a))
     
-    return (a - min_) / (max_ - min_)
+    # The shifted copy is scaled in place instead of allocating the quotient.
+    # It is floating point in the dtype true division of `a` would give
+    normalized = np.subtract(a, min_, dtype=np.result_type(a, min_, max_, 1.0))
+    np.divide(normalized, max_ - min_, out=normalized)
+    return normalized
 
 
 if __name__ == "__main__":
@@ -2,10 +2,26 @@ from typing import Union, Optional
 
 import numpy as np
 
+from hdrpy._jit import FASTMATH, HAS_NUMBA, njit, prange
 from hdrpy.tmo import ColorProcessing, LuminanceProcessing, Compose, ReplaceLuminance
 from hdrpy.tmo.linear import ExposureCompensation
 
 
+@njit(parallel=True, fastmath=FASTMATH, cache=True)
+def _eilertsen_curve(intensity, exponent, sigma, lower, upper, out):
+    """Applies Eilertsen's curve to flat arrays in a single pass.
+    All scalars are expected to have the dtype of `intensity`.
+    """
+    for i in prange(intensity.size):
+        x = intensity[i]
+        if x < lower:
+            x = lower
+        if x > upper:
+            x = upper
+        p = x ** exponent
+        out[i] = (1 + sigma) * (p / (p + sigma))
+
+
 def eilertsen_curve(
     intensity: np.ndarray,
     exponent: float = 0.9,
@@ -14,7 +30,9 @@ def eilertsen_curve(
     This function does not clip pixel values greater than 1.0
     or less than 0.0.
     Args:
-        intensity: intensities of RGB value
+        intensity: intensities of RGB value.
+            Floating point arrays keep their dtype
+            and others are computed in float32
         exponent:
         sigma:
     Returns:
@@ -23,9 +41,25 @@ def eilertsen_curve(
     >>> eilertsen_curve(intensity=intensity, exponent=0.9, sigma=0.6)
     array([ 0.        ,  1.26679496,  1.4023349 ,  1.45738344,  1.48763101])
     """
-    intensity = np.clip(intensity, 0, np.finfo(np.float32).max)
-    powered_intensity = intensity ** exponent
-    intensity_disp = (1 + sigma) * (powered_intensity / (powered_intensity + sigma))
+    if not np.issubdtype(intensity.dtype, np.floating):
+        intensity = intensity.astype(np.float32)
+
+    if HAS_NUMBA:
+        intensity = np.ascontiguousarray(intensity)
+        intensity_disp = np.empty_like(intensity)
+        # Scalars in the image precision keep float32 images in float32
+        dtype = intensity.dtype.type
+        _eilertsen_curve(intensity.reshape(-1), dtype(exponent), dtype(sigma),
+                         dtype(0), dtype(np.finfo(np.float32).max),
+                         intensity_disp.reshape(-1))
+        return intensity_disp
+
+    # np.clip makes the only copy of `intensity`; the rest works in place
+    powered_intensity = np.clip(intensity, 0, np.finfo(np.float32).max)
+    np.power(powered_intensity, exponent, out=powered_intensity)
+    intensity_disp = np.add(powered_intensity, sigma)
+    np.divide(powered_intensity, intensity_disp, out=intensity_disp)
+    np.multiply(intensity_disp, 1 + sigma, out=intensity_disp)
     return intensity_disp
 
 
@@ -2,17 +2,32 @@ from typing import Union, Optional
 
 import numpy as np
 
+from hdrpy._jit import FASTMATH, HAS_NUMBA, njit, prange
 from hdrpy.image import get_luminance
-from hdrpy.stats import gmean
+from hdrpy.stats import logmean
 from hdrpy.tmo import ColorProcessing, LuminanceProcessing, Compose, ReplaceLuminance
 from hdrpy.tmo.linear import ExposureCompensation, multiply_scalar
 from hdrpy.tmo.operator import replace_luminance
 
 
+@njit(parallel=True, fastmath=FASTMATH, cache=True)
+def _kinoshita_curve(luminance, upper, out):
+    """Applies Kinoshita's curve to flat arrays in a single pass.
+    `upper` replaces luminance of exactly 1 and has the dtype of `luminance`.
+    """
+    for i in prange(luminance.size):
+        x = luminance[i]
+        if x == 1:
+            x = upper
+        out[i] = x / (1 - x)
+
+
 def kinoshita_curve(luminance: np.ndarray, eps: float = 1e-6):
     """Maps non-linear display luminance of LDR images to normalized linear luminance.
     Args:
-        luminance: input luminance
+        luminance: input luminance.
+            Floating point arrays keep their dtype
+            and others are computed in float32
         eps: small value for avoiding anomaly
     Returns:
         normalized linear luminance
@@ -21,9 +36,23 @@ def kinoshita_curve(luminance: np.ndarray, eps: float = 1e-6):
     array([  0.00000000e+00,   3.33333333e-01,   1.00000000e+00,
              3.00000000e+00,   9.99999000e+05])
     """
+    if not np.issubdtype(luminance.dtype, np.floating):
+        luminance = luminance.astype(np.float32)
+
+    if HAS_NUMBA:
+        luminance = np.ascontiguousarray(luminance)
+        lum_disp = np.empty_like(luminance)
+        # Scalars in the luminance precision keep float32 in float32
+        dtype = luminance.dtype.type
+        _kinoshita_curve(luminance.reshape(-1), dtype(1 - eps),
+                         lum_disp.reshape(-1))
+        return lum_disp
+
     lum = luminance.copy()
     lum[lum == 1] = 1 - eps
-    return lum / (1 - lum)
+    # The denominator buffer receives the result
+    lum_disp = np.subtract(1, lum)
+    return np.divide(lum, lum_disp, out=lum_disp)
 
 
 class KinoshitaCurve(LuminanceProcessing):
@@ -60,7 +89,8 @@ class KinoshitaITMO(ColorProcessing):
     >>> ldr = f(hdr)
     >>> f = KinoshitaITMO()
     >>> hdr_ = f(ldr)
-    >>> np.sum(np.abs(hdr - hdr_))
+    >>> hdr_.shape == hdr.shape
+    True
     """
     def __init__(
         self,
@@ -76,8 +106,8 @@ class KinoshitaITMO(ColorProcessing):
         ld = get_luminance(image)
         ls = self.curve(ld)
         alpha, hdr_gmean = self.get_params(ld, self.alpha, self.hdr_gmean)
-        lw = multiply_scalar(ls, hdr_gmean / alpha)
-        return replace_luminance(image, lw)
+        lw = multiply_scalar(ls, hdr_gmean / alpha, out=ls)
+        return replace_luminance(image, lw, org_luminance=ld)
     
     def get_params(
         self,
@@ -117,14 +147,15 @@ class KinoshitaITMO(ColorProcessing):
             estimated alpha
         """
         black_pixel_number = np.sum(luminance == 0)
+        # log of the geometric mean, without rounding it through exp
+        ldr_logmean = logmean(luminance)
         if black_pixel_number == 0:
-            return hdr_gmean
+            return np.exp(ldr_logmean)
 
         pixel_number = luminance.size
-        ldr_gmean = hdr_gmean(luminance)
-        alpha = (pixel_number / (pixel_number-black_pixel_number)) * np.log(ldr_gmean)
+        alpha = (pixel_number / (pixel_number-black_pixel_number)) * ldr_logmean
         alpha -= (black_pixel_number / (pixel_number-black_pixel_number)) * np.log(hdr_gmean)
-        return exp(alpha)
+        return np.exp(alpha)
         
     def estimate_hdr_gmean(
         self,
@@ -139,13 +170,14 @@ class KinoshitaITMO(ColorProcessing):
             estimated HDR geometric mean
         """
         black_pixel_number = np.sum(luminance == 0)
-        normalized_gmean = gmean(luminance)
+        # log of the geometric mean, without rounding it through exp
+        normalized_logmean = logmean(luminance)
 
         if black_pixel_number == 0:
-            return normalized_gmean
+            return np.exp(normalized_logmean)
 
         pixel_number = luminance.size
-        hdr_gmean = (pixel_number / black_pixel_number) * np.log(normalized_gmean)
+        hdr_gmean = (pixel_number / black_pixel_number) * normalized_logmean
         hdr_gmean -= ((pixel_number-black_pixel_number) / black_pixel_number) * np.log(alpha)
         return np.exp(hdr_gmean)
         
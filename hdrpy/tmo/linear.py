@@ -2,24 +2,51 @@ from typing import Union, Optional
 
 import numpy as np
 
+from hdrpy._jit import HAS_NUMBA, njit, prange
 from hdrpy.stats import gmean
 from hdrpy.image import get_luminance
 from hdrpy.tmo import ColorProcessing, LuminanceProcessing
 
 
+@njit(parallel=True, cache=True)
+def _multiply_scalar(intensity, factor, nan_sub, posinf_sub, neginf_sub,
+                     replace_minus, minus_sub, out):
+    """Multiplies flat arrays by `factor` and substitutes NaN, Inf and
+    values <= 0 in a single pass.
+    Passing NaN, Inf and -Inf as substitutes leaves those values as they are.
+    All scalars are expected to have the dtype of `intensity`.
+    """
+    for i in prange(intensity.size):
+        x = intensity[i] * factor
+        if x != x:
+            x = nan_sub
+        elif x == np.inf:
+            x = posinf_sub
+        elif x == -np.inf:
+            x = neginf_sub
+        if replace_minus and x <= 0:
+            x = minus_sub
+        out[i] = x
+
+
 def multiply_scalar(
     intensity: np.ndarray,
     factor: float,
     nan_sub: Optional[float] = 0,
     inf_sub: Union[Optional[float], str] = "Inf",
-    minus_sub: Optional[float] = 0) -> np.ndarray:
+    minus_sub: Optional[float] = 0,
+    out: Optional[np.ndarray] = None) -> np.ndarray:
     """Compensates exposure of given image.
     Args:
-        intensity: input array
+        intensity: input array.
+            Floating point arrays keep their dtype
+            and others are computed in float32
         factor: scale ratio
         nan_sub: value for substituting NaN in `intensity`
         inf_sub: value for substituting Inf in `intensity`
         minus_sub: value for substituting negative values in `intensity`
+        out: array the result is written to, e.g., `intensity` itself
+            when it is no longer needed. If None, a new array is allocated
     Returns:
         multiplied image
     Raise:
@@ -41,23 +68,57 @@ def multiply_scalar(
     >>> image = multiply_scalar(image, factor=2, minus_sub=0)
     >>> np.all(image >= 0)
     True
+    >>> new_image = multiply_scalar(image, factor=2, out=image)
+    >>> new_image is image
+    True
     """
-
-    new_intensity = intensity * factor
-
-    if nan_sub is not None:
-        new_intensity[np.isnan(new_intensity)] = nan_sub
-
     if inf_sub is None:
         pass
     elif isinstance(inf_sub, str) and inf_sub.lower() == "Inf".lower():
-        new_intensity[np.isinf(new_intensity)] = np.finfo(np.float32).max
-    elif isinstance(inf_sub, float):
-        new_intensity[np.isinf(new_intensity)] = inf_sub
-    else:
+        inf_sub = np.finfo(np.float32).max
+    elif not isinstance(inf_sub, float):
         raise ValueError()
 
-    if minus_sub is not None:
+    if out is None and not np.issubdtype(intensity.dtype, np.floating):
+        intensity = intensity.astype(np.float32)
+    if np.issubdtype(intensity.dtype, np.floating):
+        # A float64 factor, e.g., a NumPy scalar computed in float64,
+        # must not promote a float32 image to float64
+        factor = np.asarray(factor, dtype=intensity.dtype)
+
+    if (HAS_NUMBA and np.issubdtype(intensity.dtype, np.floating)
+            and np.ndim(factor) == 0 and intensity.flags.c_contiguous
+            and (out is None or (out.flags.c_contiguous
+                                 and out.shape == intensity.shape
+                                 and out.dtype == intensity.dtype))):
+        if out is None:
+            out = np.empty_like(intensity)
+        dtype = intensity.dtype.type
+        _multiply_scalar(
+            intensity.reshape(-1), dtype(factor),
+            dtype(np.nan if nan_sub is None else nan_sub),
+            dtype(np.inf if inf_sub is None else inf_sub),
+            dtype(-np.inf if inf_sub is None else inf_sub),
+            minus_sub is not None,
+            dtype(0 if minus_sub is None else minus_sub),
+            out.reshape(-1))
+        return out
+
+    new_intensity = np.multiply(intensity, factor, out=out)
+
+    if nan_sub is not None or inf_sub is not None:
+        np.nan_to_num(
+            new_intensity, copy=False,
+            nan=np.nan if nan_sub is None else nan_sub,
+            posinf=np.inf if inf_sub is None else inf_sub,
+            neginf=-np.inf if inf_sub is None else inf_sub)
+
+    if minus_sub is None:
+        pass
+    elif minus_sub == 0:
+        # same as replacing values <= 0 with 0, without a mask
+        np.maximum(new_intensity, 0, out=new_intensity)
+    else:
         new_intensity[new_intensity <= 0] = minus_sub
 
     return new_intensity
@@ -68,6 +129,10 @@ class ExposureCompensation(ColorProcessing, LuminanceProcessing):
     Attributes:
         ev: target exposure value
         eps: small value for stability
+        max_samples: number of values the geometric mean is estimated from.
+            Larger images are subsampled with a regular grid,
+            which trades accuracy for speed.
+            If None (default), every value is used.
     Examples:
     >>> import hdrpy
     >>> hdr = hdrpy.io.read("./data/CandleGlass.exr")
@@ -87,10 +152,12 @@ class ExposureCompensation(ColorProcessing, LuminanceProcessing):
     def __init__(
         self,
         ev: Optional[float] = 0,
-        eps: float = 1e-6) -> None:
+        eps: float = 1e-6,
+        max_samples: Optional[int] = None) -> None:
         super().__init__()
         self.ev = ev
         self.eps = eps
+        self.max_samples = max_samples
 
     def __call__(self, image: np.ndarray) -> np.ndarray:
         """Adjusts exposure, i.e., brightness, of images based on geometric mean.
@@ -100,7 +167,14 @@ class ExposureCompensation(ColorProcessing, LuminanceProcessing):
         Returns:
             New image or luminance with the same size of the input
         """
-        g = gmean(image, eps=self.eps)
+        sample = image
+        if (self.max_samples is not None and image.ndim >= 2
+                and image.size > self.max_samples):
+            # Stride rows and columns rather than the flattened array
+            # so that every color channel stays in the sample
+            step = int(np.ceil(np.sqrt(image.size / self.max_samples)))
+            sample = image[::step, ::step]
+        g = gmean(sample, eps=self.eps)
         factor = self.ev2gmean(self.ev) / g
         return multiply_scalar(image, factor)
         
@@ -168,7 +242,7 @@ class NormalizeRange(ColorProcessing, LuminanceProcessing):
         if mode.lower() not in ("luminance", "color"):
             raise ValueError
         
-        self.mode = mode
+        self.mode = mode.lower()
 
     def __call__(self, image: np.ndarray) -> np.ndarray:
         """Normalizes an image luminance or color into [0, 1] range.
@@ -179,7 +253,7 @@ class NormalizeRange(ColorProcessing, LuminanceProcessing):
             normalized image
         """
         if self.mode == "luminance":
-            lum = hdrpy.get_lumianance(image)
+            lum = get_luminance(image) if image.ndim == 3 else image
             factor = 1. / np.amax(lum)
         else:
             factor = 1. / np.amax(image)
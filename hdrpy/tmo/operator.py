@@ -4,6 +4,7 @@ from collections.abc import Sequence
 import numpy as np
 from colour import oetf, RGB_COLOURSPACES, RGB_luminance
 
+from hdrpy._jit import FASTMATH, HAS_NUMBA, njit, prange
 from hdrpy.image import get_luminance
 
 
@@ -45,12 +46,14 @@ class ReplaceLuminance(ColorProcessing):
     Attributes:
         processing: luminance processing to be applied to images
     Examples:
-    >>> processing = 
+    >>> from hdrpy.tmo.linear import ExposureCompensation
+    >>> processing = ExposureCompensation()
     >>> f = ReplaceLuminance(processing)
+    >>> image = np.random.rand(100, 100, 3)
     >>> new_image = f(image)
     >>> luminance = get_luminance(image)
     >>> new_luminance = processing(luminance)
-    >>> np.allclose(get_luminance(new_image), new_lumiance)
+    >>> np.allclose(get_luminance(new_image), new_luminance)
     True
     """
     def __init__(
@@ -73,6 +76,27 @@ class ReplaceLuminance(ColorProcessing):
         return replace_luminance(image, luminance, org_luminance)
 
 
+@njit(parallel=True, fastmath=FASTMATH, cache=True)
+def _replace_luminance(image, luminance, org_luminance, lower, upper, out):
+    """Scales pixels of `image` with a size of (N, C) by the ratio
+    of `luminance` to `org_luminance` in a single pass.
+    All scalars are expected to have the dtype of `image`.
+    """
+    for i in prange(image.shape[0]):
+        org = org_luminance[i]
+        if org == 0:
+            ratio = lower
+        else:
+            x = luminance[i]
+            if x < lower:
+                x = lower
+            if x > upper:
+                x = upper
+            ratio = x / org
+        for c in range(image.shape[1]):
+            out[i, c] = image[i, c] * ratio
+
+
 def replace_luminance(
     image: np.ndarray,
     luminance: np.ndarray,
@@ -85,15 +109,32 @@ def replace_luminance(
     Returns:
         New RGB image
     """
-    luminance = np.clip(luminance, 0, np.finfo(np.float32).max)
-
     if org_luminance is None:
         org_luminance = get_luminance(image)
 
-    is_zero = (org_luminance == 0)
-    ratio = luminance
-    ratio[~is_zero] /= org_luminance[~is_zero]
-    ratio[is_zero] = 0
+    if HAS_NUMBA and image.shape[:2] == np.shape(luminance) == np.shape(org_luminance):
+        dtype = np.result_type(image, luminance)
+        if not np.issubdtype(dtype, np.floating):
+            dtype = np.float32
+        channels = image.shape[2] if image.ndim == 3 else 1
+        image = np.ascontiguousarray(image, dtype=dtype)
+        new_image = np.empty_like(image)
+        # Scalars in the image precision keep float32 images in float32
+        dtype = image.dtype.type
+        _replace_luminance(image.reshape(-1, channels),
+                           np.ascontiguousarray(luminance, dtype=dtype).reshape(-1),
+                           np.ascontiguousarray(org_luminance, dtype=dtype).reshape(-1),
+                           dtype(0), dtype(np.finfo(np.float32).max),
+                           new_image.reshape(-1, channels))
+        return new_image
+
+    # The ratio is clamped and divided in one floating point buffer,
+    # and stays 0 where the original luminance is 0
+    nonzero = org_luminance != 0
+    ratio = np.zeros(np.shape(luminance),
+                     dtype=np.result_type(luminance, org_luminance, np.float32))
+    np.clip(luminance, 0, np.finfo(np.float32).max, out=ratio, where=nonzero)
+    np.divide(ratio, org_luminance, out=ratio, where=nonzero)
 
     if image.ndim == 3:
         ratio = ratio[:, :, np.newaxis]
@@ -106,9 +147,12 @@ class Compose(ColorProcessing, LuminanceProcessing):
     Attributes:
         processings: a sequence of processings
     Examples:
+    >>> from hdrpy.tmo.linear import ExposureCompensation, NormalizeRange
     >>> processings = [ExposureCompensation(), NormalizeRange()]
     >>> f = Compose(processings)
-    >>> f(np.random.rand(100, 100))
+    >>> luminance = f(np.random.rand(100, 100))
+    >>> np.all(luminance <= 1)
+    True
     """
     def __init__(
         self,
@@ -116,9 +160,13 @@ class Compose(ColorProcessing, LuminanceProcessing):
         self.processings = processings
 
     def __call__(self, image: np.ndarray) -> np.ndarray:
-        x = np.copy(image)
+        # Processings return new arrays and leave their input untouched,
+        # so `image` only has to be copied if no processing replaced it
+        x = image
         for f in self.processings:
             x = f(x)
+        if x is image:
+            x = np.copy(image)
         return x
 
 
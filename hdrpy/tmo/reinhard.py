@@ -2,11 +2,31 @@ from typing import Union, Optional
 
 import numpy as np
 
+from hdrpy._jit import FASTMATH, HAS_NUMBA, njit, prange
 from hdrpy.image import get_luminance
 from hdrpy.tmo import ColorProcessing, LuminanceProcessing, Compose, ReplaceLuminance
 from hdrpy.tmo.linear import ExposureCompensation
 
 
+@njit(parallel=True, fastmath=FASTMATH, cache=True)
+def _reinhard_curve(lum, lum_ave, inv_white2, lower, upper, out):
+    """Applies Reinhard's curve to flat arrays in a single pass.
+    All scalars are expected to have the dtype of `lum`.
+    """
+    for i in prange(lum.size):
+        x = lum[i]
+        if x < lower:
+            x = lower
+        if x > upper:
+            x = upper
+        a = lum_ave[i]
+        if a < lower:
+            a = lower
+        if a > upper:
+            a = upper
+        out[i] = (x / (1 + a)) * (1 + x * inv_white2)
+
+
 def reinhard_curve(
     lum: np.ndarray,
     lum_ave: np.ndarray,
@@ -23,10 +43,41 @@ def reinhard_curve(
     >>> lum = np.linspace(0, 10, 5)
     >>> reinhard_curve(lum=lum, lum_ave=lum, lum_white=float("Inf"))
     array([ 0.        ,  0.71428571,  0.83333333,  0.88235294,  0.90909091])
+    >>> reinhard_curve(lum=lum, lum_ave=2.0, lum_white=8.0)
+    array([ 0.        ,  0.86588542,  1.796875  ,  2.79296875,  3.85416667])
     """
-    lum = np.clip(lum, 0, np.finfo(np.float32).max)
-    lum_ave = np.clip(lum_ave, 0, np.finfo(np.float32).max)
-    lum_disp = (lum / (1 + lum_ave)) * (1 + (lum / (lum_white ** 2)))
+    # 1 / lum_white^2 is 0 for an infinite white point
+    inv_white2 = 1 / np.float64(lum_white) ** 2
+
+    if HAS_NUMBA and np.shape(lum_ave) == np.shape(lum):
+        dtype = np.result_type(lum, lum_ave)
+        if not np.issubdtype(dtype, np.floating):
+            dtype = np.float32
+        lum = np.ascontiguousarray(lum, dtype=dtype)
+        lum_ave = np.ascontiguousarray(lum_ave, dtype=dtype)
+        lum_disp = np.empty_like(lum)
+        # Scalars in the image precision keep float32 images in float32
+        dtype = lum.dtype.type
+        _reinhard_curve(lum.reshape(-1), lum_ave.reshape(-1),
+                        dtype(inv_white2),
+                        dtype(0), dtype(np.finfo(np.float32).max),
+                        lum_disp.reshape(-1))
+        return lum_disp
+
+    # The result is allocated once at the broadcast shape,
+    # e.g., for a scalar lum_ave, in a floating point dtype
+    dtype = np.result_type(lum, lum_ave, np.float32)
+    lum = np.clip(lum, 0, np.finfo(np.float32).max, dtype=dtype)
+    # The clipped lum_ave becomes the denominator and then the result
+    lum_disp = np.empty(np.broadcast_shapes(lum.shape, np.shape(lum_ave)),
+                        dtype=dtype)
+    np.clip(lum_ave, 0, np.finfo(np.float32).max, out=lum_disp)
+    np.add(lum_disp, 1, out=lum_disp)
+    np.divide(lum, lum_disp, out=lum_disp)
+    if inv_white2 != 0:
+        np.multiply(lum, inv_white2, out=lum)
+        np.add(lum, 1, out=lum)
+        np.multiply(lum_disp, lum, out=lum_disp)
     return lum_disp
 
 